@@ -1,5 +1,6 @@
 from typing import Any, Dict, Generic, Optional, Sequence, TypeVar, Union
 
+import torch
 from pytorch_ie.core import Document
 from pytorch_ie.core.taskmodule import (
     IterableTaskEncodingDataset,
@@ -41,6 +42,7 @@ class PieDataModule(LightningDataModule, Generic[DocumentType, InputEncoding, Ta
         val_split: Optional[str] = "validation",
         test_split: Optional[str] = "test",
         show_progress_for_encode: bool = False,
+        pin_memory: Optional[bool] = None,
         **dataloader_kwargs,
     ):
         super().__init__()
@@ -53,6 +55,11 @@ class PieDataModule(LightningDataModule, Generic[DocumentType, InputEncoding, Ta
         self.test_split = test_split
         self.show_progress_for_encode = show_progress_for_encode
         self.dataloader_kwargs = dataloader_kwargs
+        # let the dataloader copy the batches to page-locked memory (in a background thread), so that the
+        # transfer to the GPU can be done asynchronously, but only if a GPU is available (if not specified)
+        if pin_memory is None:
+            pin_memory = torch.cuda.is_available()
+        self.dataloader_kwargs["pin_memory"] = pin_memory
 
         self._data: Dict[
             str,
@@ -37,6 +37,7 @@ from typing import Tuple
 
 import hydra
 import pytorch_lightning as pl
+import torch
 from omegaconf import DictConfig
 from pie_datasets import DatasetDict
 from pie_modules.models import *  # noqa: F403
@@ -74,6 +75,9 @@ def evaluate(cfg: DictConfig) -> Tuple[dict, dict]:
     log.info(f"Instantiating dataset <{cfg.dataset._target_}>")
     dataset: DatasetDict = hydra.utils.instantiate(cfg.dataset, _convert_="partial")
 
+    # needs to be set before the tokenizer of the taskmodule is used for the first time
+    utils.set_tokenizers_parallelism(num_workers=cfg.datamodule.get("num_workers", 0))
+
     # Init pytorch-ie taskmodule
     log.info(f"Instantiating taskmodule <{cfg.taskmodule._target_}>")
     taskmodule: TaskModule = hydra.utils.instantiate(cfg.taskmodule, _convert_="partial")
@@ -91,6 +95,13 @@ def evaluate(cfg: DictConfig) -> Tuple[dict, dict]:
     log.info(f"Instantiating model <{cfg.model._target_}>")
     model: PyTorchIEModel = hydra.utils.instantiate(cfg.model, _convert_="partial")
 
+    # the compiled wrapper is passed to the trainer, it shares the weights with the original model,
+    # so logging is not affected
+    model_for_trainer = model
+    if cfg.get("compile"):
+        log.info("Compiling the model with torch.compile...")
+        model_for_trainer = torch.compile(model, mode="reduce-overhead", dynamic=True)
+
     # Init lightning loggers
     logger = utils.instantiate_dict_entries(cfg, "logger")
 
@@ -112,7 +123,7 @@ def evaluate(cfg: DictConfig) -> Tuple[dict, dict]:
         utils.log_hyperparameters(logger=logger, model=model, taskmodule=taskmodule, config=cfg)
 
     log.info("Starting testing!")
-    trainer.test(model=model, datamodule=datamodule, ckpt_path=cfg.ckpt_path)
+    trainer.test(model=model_for_trainer, datamodule=datamodule, ckpt_path=cfg.ckpt_path)
 
     # for predictions use trainer.predict(...)
     # predictions = trainer.predict(model=model, dataloaders=dataloaders, ckpt_path=cfg.ckpt_path)
@@ -59,7 +59,27 @@ class MyTransformerTokenClassificationModel(
             }
         )
 
+    def transfer_batch_to_device(
+        self, batch: ModelStepInputType, device: torch.device, dataloader_idx: int
+    ) -> ModelStepInputType:
+        # BatchEncoding.to() does not support non_blocking, so we move the tensors individually. For pinned
+        # batches (see pin_memory of the datamodule), this allows to overlap the transfer with computation.
+        non_blocking = device.type == "cuda"
+        inputs, targets = batch
+        inputs = BatchEncoding(
+            data={k: v.to(device, non_blocking=non_blocking) for k, v in inputs.items()}
+        )
+        if targets is not None:
+            targets = targets.to(device, non_blocking=non_blocking)
+        return inputs, targets
+
     def forward(self, inputs: ModelInputType) -> ModelOutputType:
+        # the taskmodule may create the input ids and attention mask with smaller integer types (to reduce
+        # the memory transfer), but the embedding layer and attention expect int64
+        inputs = {
+            name: value.long() if name in ("input_ids", "attention_mask") else value
+            for name, value in inputs.items()
+        }
         return self.model(**inputs)
 
     def step(
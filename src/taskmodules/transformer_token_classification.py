@@ -7,27 +7,48 @@ workflow:
     -> Document
 """
 
+import bisect
 import copy
 import dataclasses
+import functools
+import itertools
 import logging
-from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Type, Union
+from collections import defaultdict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
+import numpy as np
 import torch
 import torch.nn.functional as F
-from pie_modules.annotations import LabeledSpan
-from pie_modules.document.processing import token_based_document_to_text_based, tokenize_document
+from pie_modules.annotations import LabeledSpan, Span
+from pie_modules.document.processing import (
+    text_based_document_to_token_based,
+    token_based_document_to_text_based,
+)
 from pie_modules.documents import (
     TextDocumentWithLabeledSpans,
     TextDocumentWithLabeledSpansAndLabeledPartitions,
     TokenBasedDocument,
 )
 from pytorch_ie import AnnotationLayer, annotation_field
-from pytorch_ie.core import TaskEncoding, TaskModule
+from pytorch_ie.core import Annotation, TaskEncoding, TaskModule
 from pytorch_ie.documents import TextBasedDocument
 from pytorch_ie.models.transformer_token_classification import ModelOutputType, ModelStepInputType
 from pytorch_ie.utils.span import bio_tags_to_spans
 from tokenizers import Encoding
-from transformers import AutoTokenizer
+from tqdm import tqdm
+from transformers import AutoTokenizer, BatchEncoding
 from typing_extensions import TypeAlias
 
 DocumentType: TypeAlias = TextBasedDocument
@@ -98,9 +119,21 @@ class MyTokenClassificationTaskModule(TaskModuleType):
             step. Default: None.
         include_ill_formed_predictions: Whether to include ill-formed predictions in the output. If False, the
             predictions are corrected to be well-formed. Default: True.
+        return_probabilities: Whether to include the probabilities of all labels in the task output. If False,
+            the softmax is not calculated and "probabilities" is None (the predicted tags are the same).
+            Default: True.
         tokenize_kwargs: Keyword arguments to pass to the tokenizer during tokenization. Default: None.
+        tokenize_batch_size: Number of texts (documents or partitions) that are passed to the tokenizer at once.
+            If None, all texts are tokenized in a single call. If tokenize_kwargs contain a padding strategy that
+            depends on the other texts (e.g. padding="longest"), the texts are tokenized individually. Default: 1024.
         pad_kwargs: Keyword arguments to pass to the tokenizer during padding. Note, that this is used to pad the
-            token ids *and* the tag ids, if available (i.e. during training or evaluation). Default: None.
+            token ids *and* the tag ids, if available (i.e. during training or evaluation). The padded input ids
+            are returned as int32 and the attention mask as int8 tensors to reduce the memory transfer, so the
+            model needs to convert them to int64, if required. Default: None.
+        pad_length_buckets: List of sequence lengths to pad the batches to. Each batch is padded to the smallest
+            length that fits all its inputs. This reduces the number of distinct input shapes which allows to reuse
+            (autotuned) GPU kernels. Batches that are longer than the largest bucket are padded as usual.
+            Default: None.
     """
 
     # list of attribute names that need to be set by _prepare()
@@ -116,8 +149,11 @@ class MyTokenClassificationTaskModule(TaskModuleType):
         max_window: Optional[int] = None,
         window_overlap: int = 0,
         include_ill_formed_predictions: bool = True,
+        return_probabilities: bool = True,
         tokenize_kwargs: Optional[Dict[str, Any]] = None,
+        tokenize_batch_size: Optional[int] = 1024,
         pad_kwargs: Optional[Dict[str, Any]] = None,
+        pad_length_buckets: Optional[List[int]] = None,
         **kwargs,
     ) -> None:
         super().__init__(**kwargs)
@@ -146,10 +182,18 @@ class MyTokenClassificationTaskModule(TaskModuleType):
         self.labels = labels
         self.label_pad_token_id = label_pad_token_id
         self.include_ill_formed_predictions = include_ill_formed_predictions
+        self.return_probabilities = return_probabilities
         self.tokenize_kwargs = tokenize_kwargs or {}
+        self.tokenize_batch_size = tokenize_batch_size
         self.pad_kwargs = pad_kwargs or {}
+        self.pad_length_buckets = sorted(pad_length_buckets) if pad_length_buckets else None
 
-        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name_or_path)
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name_or_path, use_fast=True)
+        if not self.tokenizer.is_fast:
+            raise ValueError(
+                f"the tokenizer for {tokenizer_name_or_path} is not a fast tokenizer, but {type(self).__name__} "
+                f"requires one (e.g. to get the tokenizer encodings)"
+            )
 
     @property
     def document_type(self) -> Optional[Type[TextBasedDocument]]:
@@ -183,32 +227,36 @@ class MyTokenClassificationTaskModule(TaskModuleType):
         return document[self.span_annotation]
 
     def _prepare(self, documents: Sequence[DocumentType]) -> None:
-        # collect all possible labels
-        labels: Set[str] = set()
-        for document in documents:
-            spans: AnnotationLayer[LabeledSpan] = self.get_span_layer(document)
-
-            for span in spans:
-                labels.add(span.label)
+        # collect all possible labels in a single pass
+        labels: Set[str] = {
+            span.label for document in documents for span in self.get_span_layer(document)
+        }
 
         self.labels = sorted(labels)
         logger.info(f"Collected {len(self.labels)} labels from the data: {self.labels}")
 
     def _post_prepare(self):
-        # create the real token labels (BIO scheme) from the labels
-        self.label_to_id = {"O": 0}
-        current_id = 1
-        for label in sorted(self.labels):
-            for prefix in ["B", "I"]:
-                self.label_to_id[f"{prefix}-{label}"] = current_id
-                current_id += 1
-
-        self.id_to_label = {v: k for k, v in self.label_to_id.items()}
-
-    def encode_input(
-        self,
-        document: TextBasedDocument,
-    ) -> Optional[Union[TaskEncodingType, Sequence[TaskEncodingType]]]:
+        # create the real token labels (BIO scheme) from the labels. The ids are consecutive, so we keep
+        # them also as tuple to look up the labels by position (faster than the dict)
+        self._id_to_label_tuple = ("O",) + tuple(
+            f"{prefix}-{label}" for label in sorted(self.labels) for prefix in ["B", "I"]
+        )
+        self.id_to_label = dict(enumerate(self._id_to_label_tuple))
+        self.label_to_id = {label: idx for idx, label in self.id_to_label.items()}
+        # for fast membership checks in encode_target()
+        self._label_set = frozenset(self.labels)
+
+    def _tokenize_documents(
+        self, documents: Sequence[DocumentType], show_progress: bool = False
+    ) -> List[List[TokenBasedDocument]]:
+        """Tokenize the documents (or their partitions, if a partition annotation is provided) and
+        convert them to token based documents.
+
+        In contrast to calling tokenize_document() for each document, the texts of all documents
+        (and partitions) are passed to the tokenizer in batched calls. The result contains a list
+        of token based documents (one per window / partition) for each input document and is the
+        same as the one of tokenize_document().
+        """
         if self.partition_annotation is None:
             tokenized_document_type = TokenDocumentWithLabeledSpans
             casted_document_type = TextDocumentWithLabeledSpans
@@ -220,28 +268,134 @@ class MyTokenClassificationTaskModule(TaskModuleType):
                 self.span_annotation: "labeled_spans",
                 self.partition_annotation: "labeled_partitions",
             }
-        casted_document = document.as_type(casted_document_type, field_mapping=field_mapping)
-        tokenized_docs = tokenize_document(
-            casted_document,
-            tokenizer=self.tokenizer,
-            result_document_type=tokenized_document_type,
-            partition_layer=(
-                "labeled_partitions" if self.partition_annotation is not None else None
-            ),
-            strict_span_conversion=False,
-            **self.tokenize_kwargs,
+        casted_documents = [
+            document.as_type(casted_document_type, field_mapping=field_mapping)
+            for document in documents
+        ]
+
+        # collect the texts to tokenize as (document index, partition) pairs
+        partitions: List[Tuple[int, Span]] = []
+        for doc_idx, casted_document in enumerate(casted_documents):
+            if self.partition_annotation is None:
+                partitions.append((doc_idx, Span(start=0, end=len(casted_document.text))))
+            else:
+                partitions.extend(
+                    (doc_idx, partition) for partition in casted_document.labeled_partitions
+                )
+
+        result: List[List[TokenBasedDocument]] = [[] for _ in casted_documents]
+        if len(partitions) == 0:
+            return result
+
+        texts = [
+            casted_documents[doc_idx].text[partition.start : partition.end]
+            for doc_idx, partition in partitions
+        ]
+        # As in tokenize_document(): if a text is provided via the tokenize_kwargs, it is used as the first
+        # sequence and the document (or partition) texts are passed as the second one (text_pair).
+        tokenize_kwargs = dict(self.tokenize_kwargs)
+        first_text = tokenize_kwargs.pop("text", None)
+        sequence_index = 0 if first_text is None else 1
+
+        batch_size = self.tokenize_batch_size or len(texts)
+        # Padding to the longest sequence depends on the other texts in the batch. To get the same
+        # result as when tokenizing each text individually, we do not batch the texts in that case.
+        if tokenize_kwargs.get("padding", False) not in (False, "do_not_pad", "max_length"):
+            batch_size = 1
+
+        # tokenize in batches, each batch is processed in parallel by the (fast) tokenizer
+        encodings_with_sample_indices: List[Tuple[Encoding, int]] = []
+        for batch_start in range(0, len(texts), batch_size):
+            batch_texts = texts[batch_start : batch_start + batch_size]
+            if first_text is None:
+                tokenized_texts = self.tokenizer(batch_texts, **tokenize_kwargs)
+            else:
+                tokenized_texts = self.tokenizer(
+                    [first_text] * len(batch_texts), text_pair=batch_texts, **tokenize_kwargs
+                )
+            # if overflowing tokens are returned, the encodings of all windows are flattened
+            sample_mapping = tokenized_texts.get(
+                "overflow_to_sample_mapping", range(len(batch_texts))
+            )
+            encodings_with_sample_indices.extend(
+                (encoding, batch_start + sample_idx)
+                for encoding, sample_idx in zip(tokenized_texts.encodings, sample_mapping)
+            )
+
+        converted_spans: List[Set[LabeledSpan]] = [set() for _ in casted_documents]
+        for encoding, sample_idx in tqdm(
+            encodings_with_sample_indices,
+            disable=not show_progress,
+            desc="convert to token based documents",
+        ):
+            doc_idx, partition = partitions[sample_idx]
+            token_offset_mapping = [
+                offsets if sequence_id == sequence_index else (0, 0)
+                for sequence_id, offsets in zip(encoding.sequence_ids, encoding.offsets)
+            ]
+            char_to_token: Optional[Callable[[int], Optional[int]]] = functools.partial(
+                encoding.char_to_token, sequence_index=sequence_index
+            )
+            if partition.start > 0:
+                token_offset_mapping = [
+                    (start + partition.start, end + partition.start)
+                    for start, end in token_offset_mapping
+                ]
+                char_to_token = None
+            added_annotations: Dict[str, Dict[Annotation, Annotation]] = defaultdict(dict)
+            tokenized_document = text_based_document_to_token_based(
+                casted_documents[doc_idx],
+                tokens=encoding.tokens,
+                result_document_type=tokenized_document_type,
+                token_offset_mapping=token_offset_mapping,
+                char_to_token=char_to_token,
+                strict_span_conversion=False,
+                verbose=False,
+                added_annotations=added_annotations,
+            )
+            tokenized_document.metadata["tokenizer_encoding"] = encoding
+            result[doc_idx].append(tokenized_document)
+            converted_spans[doc_idx].update(added_annotations["labeled_spans"])
+
+        for casted_document, current_converted_spans in zip(casted_documents, converted_spans):
+            missed_spans = set(casted_document.labeled_spans) - current_converted_spans
+            if len(missed_spans) > 0:
+                logger.warning(
+                    f"could not convert all annotations from document with id={casted_document.id} to token "
+                    f"based documents, missed annotations: {sorted(str(span) for span in missed_spans)}"
+                )
+
+        return result
+
+    def encode_inputs(
+        self,
+        documents: Sequence[DocumentType],
+        show_progress: bool = False,
+    ) -> Tuple[Sequence[TaskEncodingType], Sequence[DocumentType]]:
+        # a document might be generated on the fly (e.g. with a Dataset), so we collect them here
+        documents_in_order = list(documents)
+        tokenized_docs_per_document = self._tokenize_documents(
+            documents_in_order, show_progress=show_progress
         )
 
         task_encodings: List[TaskEncodingType] = []
-        for tokenized_doc in tokenized_docs:
-            task_encodings.append(
-                TaskEncoding(
-                    document=document,
-                    inputs=tokenized_doc.metadata["tokenizer_encoding"],
-                    metadata={"tokenized_document": tokenized_doc},
+        for document, tokenized_docs in zip(documents_in_order, tokenized_docs_per_document):
+            for tokenized_doc in tokenized_docs:
+                task_encodings.append(
+                    TaskEncoding(
+                        document=document,
+                        inputs=tokenized_doc.metadata["tokenizer_encoding"],
+                        metadata={"tokenized_document": tokenized_doc},
+                    )
                 )
-            )
 
+        return task_encodings, documents_in_order
+
+    def encode_input(
+        self,
+        document: TextBasedDocument,
+    ) -> Optional[Union[TaskEncodingType, Sequence[TaskEncodingType]]]:
+        task_encodings, _ = self.encode_inputs([document])
         return task_encodings
 
     def encode_target(
@@ -252,16 +406,18 @@ class MyTokenClassificationTaskModule(TaskModuleType):
         tokenized_document = metadata["tokenized_document"]
         tokenizer_encoding: Encoding = tokenized_document.metadata["tokenizer_encoding"]
 
+        # Note: each access to an attribute of the encoding creates a new list, so we do that only once
         tag_sequence = [
-            None if tokenizer_encoding.special_tokens_mask[j] else "O"
-            for j in range(len(tokenizer_encoding.ids))
+            None if is_special_token else "O"
+            for is_special_token in tokenizer_encoding.special_tokens_mask
         ]
         if self.labels is None:
             raise ValueError(
                 "'labels' must be set before calling encode_target(). Was prepare() called on the taskmodule?"
             )
+        label_set = self._label_set
         for span in tokenized_document.labeled_spans:
-            if span.label not in self.labels:
+            if span.label not in label_set:
                 continue
             start = span.start
             end = span.end
@@ -273,38 +429,89 @@ class MyTokenClassificationTaskModule(TaskModuleType):
             for j in range(start + 1, end):
                 tag_sequence[j] = f"I-{span.label}"
 
+        # bind to local variables to avoid the attribute lookups for each tag
+        label_to_id = self.label_to_id
+        label_pad_token_id = self.label_pad_token_id
         targets = [
-            self.label_to_id[tag] if tag is not None else self.label_pad_token_id
-            for tag in tag_sequence
+            label_to_id[tag] if tag is not None else label_pad_token_id for tag in tag_sequence
         ]
 
         return targets
 
+    def _pad_input_ids(self, input_ids: List[List[int]], lengths: List[int]) -> BatchEncoding:
+        pad_kwargs = self.pad_kwargs
+        max_length = max(lengths)
+        if self.pad_length_buckets is not None:
+            # pad to the smallest bucket that fits all inputs to get a small set of distinct sequence lengths
+            bucket_idx = bisect.bisect_left(self.pad_length_buckets, max_length)
+            if bucket_idx < len(self.pad_length_buckets):
+                pad_kwargs = {
+                    **pad_kwargs,
+                    "padding": "max_length",
+                    "max_length": self.pad_length_buckets[bucket_idx],
+                }
+
+        # If all inputs have the same length and the padding would not change that, we can skip the
+        # call to the tokenizer and create the tensors directly. To be safe, this is only done if
+        # no padding parameters other than pad_to_multiple_of are set.
+        pad_to_multiple_of = pad_kwargs.get("pad_to_multiple_of") or 1
+        if (
+            set(pad_kwargs) <= {"pad_to_multiple_of"}
+            and min(lengths) == max_length
+            and max_length % pad_to_multiple_of == 0
+        ):
+            data = {"input_ids": torch.tensor(input_ids, dtype=torch.int32)}
+            if "attention_mask" in self.tokenizer.model_input_names:
+                data["attention_mask"] = torch.ones_like(data["input_ids"], dtype=torch.int8)
+            return BatchEncoding(data=data)
+
+        inputs = self.tokenizer.pad({"input_ids": input_ids}, return_tensors="pt", **pad_kwargs)
+        # use smaller integer types than int64 (the default) to reduce the memory (transfer)
+        inputs["input_ids"] = inputs["input_ids"].to(torch.int32)
+        if "attention_mask" in inputs:
+            inputs["attention_mask"] = inputs["attention_mask"].to(torch.int8)
+        return inputs
+
     def collate(self, task_encodings: Sequence[TaskEncodingType]) -> ModelStepInputType:
         input_ids = [task_encoding.inputs.ids for task_encoding in task_encodings]
-        inputs = self.tokenizer.pad(
-            {"input_ids": input_ids}, return_tensors="pt", **self.pad_kwargs
-        )
+        lengths = [len(input_ids_single) for input_ids_single in input_ids]
+        inputs = self._pad_input_ids(input_ids, lengths=lengths)
 
         if not task_encodings[0].has_targets:
             return inputs, None
 
         tag_ids = [task_encoding.targets for task_encoding in task_encodings]
-        targets = self.tokenizer.pad(
-            {"input_ids": tag_ids}, return_tensors="pt", **self.pad_kwargs
-        )["input_ids"]
+        # the tag ids have the same lengths as the input ids
+        lengths_tensor = torch.tensor(lengths)
+        batch_size, max_length = inputs["input_ids"].shape
+        positions = torch.arange(max_length)
+        if self.pad_kwargs.get("padding_side", self.tokenizer.padding_side) == "left":
+            non_pad_mask = positions >= (max_length - lengths_tensor).unsqueeze(1)
+        else:
+            non_pad_mask = positions < lengths_tensor.unsqueeze(1)
 
-        # set the padding label to the label_pad_token_id
-        pad_mask = inputs["input_ids"] == self.tokenizer.pad_token_id
-        targets[pad_mask] = self.label_pad_token_id
+        # fill all non-padding positions at once with the concatenated tag ids, the padding positions
+        # get the label_pad_token_id
+        targets = torch.full(
+            (batch_size, max_length), fill_value=self.label_pad_token_id, dtype=torch.int64
+        )
+        targets[non_pad_mask] = torch.from_numpy(
+            np.fromiter(itertools.chain.from_iterable(tag_ids), dtype=np.int64, count=sum(lengths))
+        )
 
         return inputs, targets
 
     def unbatch_output(self, model_output: ModelOutputType) -> Sequence[TaskOutputType]:
-        logits = model_output["logits"]
-        probabilities = F.softmax(logits, dim=-1).detach().cpu().numpy()
-        indices = torch.argmax(logits, dim=-1).detach().cpu().numpy()
-        tags = [[self.id_to_label[e] for e in b] for b in indices]
+        logits = model_output["logits"].detach()
+        # convert to a nested list of python ints (in one go) which are much faster to look up than numpy ints
+        indices = torch.argmax(logits, dim=-1).cpu().tolist()
+        id_to_label = self._id_to_label_tuple
+        tags = [[id_to_label[e] for e in b] for b in indices]
+        if not self.return_probabilities:
+            return [{"tags": t, "probabilities": None} for t in tags]
+
+        # calculate the softmax in full precision (the logits may be half precision, e.g. bfloat16)
+        probabilities = F.softmax(logits.float(), dim=-1).cpu().numpy()
         return [{"tags": t, "probabilities": p} for t, p in zip(tags, probabilities)]
 
     def create_annotations_from_output(
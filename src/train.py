@@ -38,6 +38,7 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import hydra
 import pytorch_lightning as pl
+import torch
 from omegaconf import DictConfig
 from pie_datasets import DatasetDict
 from pie_modules.models import *  # noqa: F403
@@ -99,15 +100,17 @@ def train(cfg: DictConfig) -> Tuple[dict, dict]:
     if cfg.get("seed"):
         pl.seed_everything(cfg.seed, workers=True)
 
+    # needs to be set before the tokenizer of the taskmodule is used for the first time
+    utils.set_tokenizers_parallelism(num_workers=cfg.datamodule.get("num_workers", 0))
+
     # Init pytorch-ie taskmodule
     log.info(f"Instantiating taskmodule <{cfg.taskmodule._target_}>")
     taskmodule: TaskModule = hydra.utils.instantiate(cfg.taskmodule, _convert_="partial")
 
     # Init pytorch-ie dataset
     log.info(f"Instantiating dataset <{cfg.dataset._target_}>")
-    dataset: DatasetDict = hydra.utils.instantiate(
-        cfg.dataset,
-        _convert_="partial",
+    dataset: DatasetDict = utils.instantiate_dataset(
+        cfg.dataset, use_cache=cfg.get("cache_dataset", False)
     )
 
     # auto-convert the dataset if the taskmodule specifies a document type
@@ -165,6 +168,13 @@ def train(cfg: DictConfig) -> Tuple[dict, dict]:
             state_dict_to_load = loaded_state_dict
         model.load_state_dict(state_dict_to_load, strict=not has_prefix_mapping)
 
+    # the compiled wrapper is passed to the trainer, it shares the weights with the original model,
+    # so saving is not affected
+    model_for_trainer = model
+    if cfg.get("compile"):
+        log.info("Compiling the model with torch.compile...")
+        model_for_trainer = torch.compile(model, mode="reduce-overhead", dynamic=True)
+
     log.info("Instantiating callbacks...")
     callbacks: List[Callback] = utils.instantiate_dict_entries(cfg, key="callbacks")
 
@@ -196,7 +206,7 @@ def train(cfg: DictConfig) -> Tuple[dict, dict]:
 
     if cfg.get("train"):
         log.info("Starting training!")
-        trainer.fit(model=model, datamodule=datamodule, ckpt_path=cfg.get("ckpt_path"))
+        trainer.fit(model=model_for_trainer, datamodule=datamodule, ckpt_path=cfg.get("ckpt_path"))
 
     train_metrics = trainer.callback_metrics
 
@@ -226,7 +236,9 @@ def train(cfg: DictConfig) -> Tuple[dict, dict]:
         log.info("Starting validation!")
         if best_ckpt_path == "":
             log.warning("Best ckpt not found! Using current weights for validation...")
-        trainer.validate(model=model, datamodule=datamodule, ckpt_path=best_ckpt_path or None)
+        trainer.validate(
+            model=model_for_trainer, datamodule=datamodule, ckpt_path=best_ckpt_path or None
+        )
     elif cfg.get("train"):
         log.warning(
             "Validation after training is skipped! That means, the finally reported validation scores are "
@@ -237,7 +249,9 @@ def train(cfg: DictConfig) -> Tuple[dict, dict]:
         log.info("Starting testing!")
         if best_ckpt_path == "":
             log.warning("Best ckpt not found! Using current weights for testing...")
-        trainer.test(model=model, datamodule=datamodule, ckpt_path=best_ckpt_path or None)
+        trainer.test(
+            model=model_for_trainer, datamodule=datamodule, ckpt_path=best_ckpt_path or None
+        )
 
     test_metrics = trainer.callback_metrics
 
@@ -1,4 +1,15 @@
-from .config_utils import execute_pipeline, instantiate_dict_entries, prepare_omegaconf
+from .config_utils import (
+    execute_pipeline,
+    instantiate_dataset,
+    instantiate_dict_entries,
+    prepare_omegaconf,
+)
 from .logging_utils import close_loggers, get_pylogger, log_hyperparameters
 from .rich_utils import enforce_tags, print_config_tree
-from .task_utils import extras, replace_sys_args_with_values_from_files, save_file, task_wrapper
+from .task_utils import (
+    extras,
+    replace_sys_args_with_values_from_files,
+    save_file,
+    set_tokenizers_parallelism,
+    task_wrapper,
+)
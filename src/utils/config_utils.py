@@ -1,5 +1,5 @@
 from copy import copy
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 
 from hydra.utils import instantiate
 from omegaconf import DictConfig, OmegaConf
@@ -8,6 +8,10 @@ from src.utils.logging_utils import get_pylogger
 
 logger = get_pylogger(__name__)
 
+# cache for instantiate_dataset(), maps the resolved dataset config (as yaml string) to the dataset.
+# It holds at most one entry to not keep multiple datasets in memory.
+_DATASET_CACHE: Dict[str, Any] = {}
+
 
 def execute_pipeline(
     input: Any,
@@ -63,6 +67,29 @@ def instantiate_dict_entries(
     return entries
 
 
+def instantiate_dataset(config: DictConfig, use_cache: bool = False) -> Any:
+    """Instantiates the dataset from the config. If use_cache is True, the most recently
+    instantiated dataset is memoized by its resolved config, so that repeated calls with the same
+    config within the same process (e.g. for the jobs of a multirun or hyperparameter search) do
+    not load and preprocess the dataset again. A call with a different config replaces the cached
+    dataset.
+
+    Note, that the cached dataset is shared between the calls, so it should not be modified in
+    place.
+    """
+    if not use_cache:
+        return instantiate(config, _convert_="partial")
+
+    key = OmegaConf.to_yaml(config, resolve=True)
+    if key in _DATASET_CACHE:
+        logger.info("Reusing the cached dataset")
+    else:
+        # release the previous dataset before loading the new one
+        _DATASET_CACHE.clear()
+        _DATASET_CACHE[key] = instantiate(config, _convert_="partial")
+    return _DATASET_CACHE[key]
+
+
 def prepare_omegaconf():
     # register replace resolver (used to replace "/" with "-" in names to use them as e.g. wandb project names)
     if not OmegaConf.has_resolver("replace"):
@@ -14,6 +14,9 @@ from src.utils.rich_utils import enforce_tags, print_config_tree
 
 log = get_pylogger(__name__)
 
+# whether TOKENIZERS_PARALLELISM was set by set_tokenizers_parallelism() (and not from outside)
+_tokenizers_parallelism_set_here = False
+
 
 def task_wrapper(task_func: Callable) -> Callable:
     """Optional decorator that wraps the task function in extra utilities.
@@ -83,6 +86,31 @@ def extras(cfg: DictConfig) -> None:
         print_config_tree(cfg, resolve=True, save_to_file=True)
 
 
+def set_tokenizers_parallelism(num_workers: int) -> None:
+    """Enables the parallelism of the (fast) HuggingFace tokenizers if the dataloader does not use
+    worker processes. Otherwise, it is disabled to avoid deadlocks after forking the workers.
+
+    If the environment variable TOKENIZERS_PARALLELISM was already set before the first call (e.g.
+    by the user), it is left unchanged. Otherwise, it is updated on each call, e.g. for subsequent
+    jobs of a multirun with different numbers of workers.
+    """
+    global _tokenizers_parallelism_set_here
+
+    current_value = os.environ.get("TOKENIZERS_PARALLELISM")
+    if current_value is not None and not _tokenizers_parallelism_set_here:
+        log.info(
+            f"Tokenizers parallelism is already set: <TOKENIZERS_PARALLELISM={current_value}>"
+        )
+        return
+
+    value = "true" if num_workers == 0 else "false"
+    os.environ["TOKENIZERS_PARALLELISM"] = value
+    _tokenizers_parallelism_set_here = True
+    log.info(
+        f"Set tokenizers parallelism for num_workers={num_workers}: <TOKENIZERS_PARALLELISM={value}>"
+    )
+
+
 @rank_zero_only
 def save_file(path: str, content: str) -> None:
     """Save file in rank zero mode (only on one process in multi-GPU setup)."""
@@ -0,0 +1,65 @@
+import pytest
+import torch
+from transformers import BatchEncoding
+
+from src.models import MyTransformerTokenClassificationModel
+
+
+@pytest.fixture(scope="module")
+def model():
+    # transfer_batch_to_device does not depend on the model weights, so we skip the __init__ to not
+    # load the transformer model
+    return MyTransformerTokenClassificationModel.__new__(MyTransformerTokenClassificationModel)
+
+
+@pytest.fixture
+def inputs():
+    return BatchEncoding(
+        data={
+            "input_ids": torch.tensor([[101, 7592, 102, 0]], dtype=torch.int32),
+            "attention_mask": torch.tensor([[1, 1, 1, 0]], dtype=torch.int8),
+        }
+    )
+
+
+@pytest.fixture
+def targets():
+    return torch.tensor([[-100, 1, -100, -100]])
+
+
+def assert_inputs_on_device(transferred_inputs, inputs, device):
+    assert isinstance(transferred_inputs, BatchEncoding)
+    assert set(transferred_inputs) == set(inputs)
+    for name, value in inputs.items():
+        assert transferred_inputs[name].device == device
+        assert transferred_inputs[name].dtype == value.dtype
+        torch.testing.assert_close(transferred_inputs[name], value)
+
+
+def test_transfer_batch_to_device(model, inputs, targets):
+    device = torch.device("cpu")
+    transferred_inputs, transferred_targets = model.transfer_batch_to_device(
+        (inputs, targets), device=device, dataloader_idx=0
+    )
+    assert_inputs_on_device(transferred_inputs, inputs, device)
+    assert transferred_targets.device == device
+    torch.testing.assert_close(transferred_targets, targets)
+
+
+def test_transfer_batch_to_device_without_targets(model, inputs):
+    device = torch.device("cpu")
+    transferred_inputs, transferred_targets = model.transfer_batch_to_device(
+        (inputs, None), device=device, dataloader_idx=0
+    )
+    assert_inputs_on_device(transferred_inputs, inputs, device)
+    assert transferred_targets is None
+
+
+def test_transfer_batch_to_device_with_list_batch(model, inputs, targets):
+    # the pin_memory of the DataLoader returns the batch as a list instead of a tuple
+    device = torch.device("cpu")
+    transferred_inputs, transferred_targets = model.transfer_batch_to_device(
+        [inputs, targets], device=device, dataloader_idx=0
+    )
+    assert_inputs_on_device(transferred_inputs, inputs, device)
+    torch.testing.assert_close(transferred_targets, targets)
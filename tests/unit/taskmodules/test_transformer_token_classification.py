@@ -1,3 +1,4 @@
+import copy
 import logging
 from collections import defaultdict
 from dataclasses import dataclass
@@ -6,6 +7,7 @@ from typing import Any, Dict, List
 import pytest
 import torch
 from pie_modules.annotations import LabeledSpan
+from pie_modules.document.processing import tokenize_document
 from pie_modules.documents import (
     TextDocumentWithLabeledSpans,
     TextDocumentWithLabeledSpansAndLabeledPartitions,
@@ -15,6 +17,10 @@ from pytorch_ie.documents import TextBasedDocument
 from transformers import BatchEncoding
 
 from src.taskmodules import MyTokenClassificationTaskModule
+from src.taskmodules.transformer_token_classification import (
+    TokenDocumentWithLabeledSpans,
+    TokenDocumentWithLabeledSpansAndLabeledPartitions,
+)
 
 
 def _config_to_str(cfg: Dict[str, Any]) -> str:
@@ -213,6 +219,102 @@ def test_task_encodings_without_targets(task_encodings_without_targets, taskmodu
         raise ValueError(f"unknown config: {config}")
 
 
+def test_encode_input_matches_batched(task_encodings_without_targets, taskmodule, documents):
+    # encoding the documents one by one should give the same result as the batched encoding
+    task_encodings = []
+    for document in documents:
+        task_encodings.extend(taskmodule.encode_input(document))
+
+    assert [task_encoding.document for task_encoding in task_encodings] == [
+        task_encoding.document for task_encoding in task_encodings_without_targets
+    ]
+    assert [task_encoding.inputs.ids for task_encoding in task_encodings] == [
+        task_encoding.inputs.ids for task_encoding in task_encodings_without_targets
+    ]
+
+
+def _tokenize_documents_individually(taskmodule, documents):
+    # reference: tokenize each document with tokenize_document() from pie_modules
+    if taskmodule.partition_annotation is None:
+        casted_document_type = TextDocumentWithLabeledSpans
+        tokenized_document_type = TokenDocumentWithLabeledSpans
+        field_mapping = {taskmodule.span_annotation: "labeled_spans"}
+    else:
+        casted_document_type = TextDocumentWithLabeledSpansAndLabeledPartitions
+        tokenized_document_type = TokenDocumentWithLabeledSpansAndLabeledPartitions
+        field_mapping = {
+            taskmodule.span_annotation: "labeled_spans",
+            taskmodule.partition_annotation: "labeled_partitions",
+        }
+    return [
+        tokenize_document(
+            document.as_type(casted_document_type, field_mapping=field_mapping),
+            tokenizer=taskmodule.tokenizer,
+            result_document_type=tokenized_document_type,
+            partition_layer=(
+                "labeled_partitions" if taskmodule.partition_annotation is not None else None
+            ),
+            strict_span_conversion=False,
+            **taskmodule.tokenize_kwargs,
+        )
+        for document in documents
+    ]
+
+
+def _simplify_tokenized_documents(tokenized_documents_per_document):
+    return [
+        [
+            (
+                tokenized_document.tokens,
+                tokenized_document.metadata["tokenizer_encoding"].ids,
+                [(span.start, span.end, span.label) for span in tokenized_document.labeled_spans],
+            )
+            for tokenized_document in tokenized_documents
+        ]
+        for tokenized_documents in tokenized_documents_per_document
+    ]
+
+
+def assert_tokenized_like_tokenize_document(taskmodule, documents):
+    tokenized = taskmodule._tokenize_documents(documents)
+    expected = _tokenize_documents_individually(taskmodule, documents)
+    assert _simplify_tokenized_documents(tokenized) == _simplify_tokenized_documents(expected)
+
+
+def test_tokenize_documents_matches_tokenize_document(taskmodule, documents):
+    assert_tokenized_like_tokenize_document(taskmodule, documents)
+
+
+def test_tokenize_documents_with_text_pair(documents):
+    taskmodule = MyTokenClassificationTaskModule(
+        tokenizer_name_or_path="bert-base-uncased",
+        span_annotation="entities",
+        tokenize_kwargs={"text": "Find all entities:"},
+    )
+    assert_tokenized_like_tokenize_document(taskmodule, documents)
+
+    tokenized = taskmodule._tokenize_documents(documents)
+    assert tokenized[0][0].tokens[:6] == ("[CLS]", "find", "all", "entities", ":", "[SEP]")
+    # the entity "Mount Everest" refers to the tokens of the document text (the second sequence)
+    assert [(span.start, span.end, span.label) for span in tokenized[0][0].labeled_spans] == [
+        (6, 8, "LOC")
+    ]
+
+
+def test_tokenize_documents_with_padding(documents):
+    short_document = ExampleDocument(text="Hello.", id="doc3")
+    taskmodule = MyTokenClassificationTaskModule(
+        tokenizer_name_or_path="bert-base-uncased",
+        span_annotation="entities",
+        tokenize_kwargs={"padding": "longest"},
+    )
+    assert_tokenized_like_tokenize_document(taskmodule, documents + [short_document])
+
+    # the short document is not padded to the length of the other documents
+    tokenized = taskmodule._tokenize_documents(documents + [short_document])
+    assert tokenized[2][0].tokens == ("[CLS]", "hello", ".", "[SEP]")
+
+
 @pytest.fixture(scope="module")
 def task_encodings(taskmodule, documents):
     return taskmodule.encode(documents, encode_target=True)
@@ -423,15 +525,36 @@ def test_collate(batch, config):
 
     inputs_expected = BatchEncoding(
         data={
-            "input_ids": torch.tensor(input_ids_list, dtype=torch.int64),
-            "attention_mask": torch.tensor(attention_mask_list, dtype=torch.int64),
+            "input_ids": torch.tensor(input_ids_list, dtype=torch.int32),
+            "attention_mask": torch.tensor(attention_mask_list, dtype=torch.int8),
         }
     )
     assert set(inputs.data) == set(inputs_expected.data)
+    for key in inputs_expected.data:
+        assert torch.equal(inputs[key], inputs_expected[key])
     targets_expected = torch.tensor(targets_list, dtype=torch.int64)
     assert torch.equal(targets, targets_expected)
 
 
+def test_collate_with_pad_length_buckets(documents):
+    taskmodule = MyTokenClassificationTaskModule(
+        tokenizer_name_or_path="bert-base-uncased",
+        span_annotation="entities",
+        pad_length_buckets=[32, 4, 16],
+    )
+    taskmodule.prepare(documents)
+    task_encodings = taskmodule.encode(documents, encode_target=True)
+    inputs, targets = taskmodule.collate(task_encodings)
+
+    # the longest input has 12 tokens, so the batch is padded to the bucket of length 16
+    assert inputs.input_ids.shape == (2, 16)
+    assert inputs.attention_mask.tolist() == [[1] * 12 + [0] * 4, [1] * 12 + [0] * 4]
+    assert targets.tolist() == [
+        [-100, 1, 2, 0, 0, 0, 0, 0, 0, 0, 0, -100, -100, -100, -100, -100],
+        [-100, 3, 0, 0, 0, 0, 3, 0, 0, 0, 0, -100, -100, -100, -100, -100],
+    ]
+
+
 # This is not used, but can be used to create a batch of task encodings with targets for the unbatched_outputs fixture.
 @pytest.fixture(scope="module")
 def real_model_output(batch, taskmodule):
@@ -648,6 +771,22 @@ def test_unbatched_output(unbatched_outputs, config):
         raise ValueError(f"unknown config: {config}")
 
 
+def test_unbatched_output_without_probabilities(taskmodule, model_output, unbatched_outputs):
+    # use a copy to not modify the module scoped taskmodule fixture
+    taskmodule_without_probabilities = copy.copy(taskmodule)
+    taskmodule_without_probabilities.return_probabilities = False
+    unbatched_outputs_without_probabilities = taskmodule_without_probabilities.unbatch_output(
+        model_output
+    )
+
+    assert len(unbatched_outputs_without_probabilities) == len(unbatched_outputs)
+    for output_without_probabilities, output in zip(
+        unbatched_outputs_without_probabilities, unbatched_outputs
+    ):
+        assert output_without_probabilities["tags"] == output["tags"]
+        assert output_without_probabilities["probabilities"] is None
+
+
 @pytest.fixture(scope="module")
 def annotations_from_output(taskmodule, task_encodings_for_batch, unbatched_outputs, config):
     named_annotations_per_document = defaultdict(list)
@@ -0,0 +1,42 @@
+import pytest
+from omegaconf import OmegaConf
+
+from src.utils import config_utils, instantiate_dataset
+
+
+@pytest.fixture(autouse=True)
+def clear_dataset_cache():
+    config_utils._DATASET_CACHE.clear()
+    yield
+    config_utils._DATASET_CACHE.clear()
+
+
+def _dataset_config(name: str):
+    return OmegaConf.create({"_target_": "builtins.dict", "name": name})
+
+
+def test_instantiate_dataset():
+    dataset = instantiate_dataset(_dataset_config("a"))
+    assert dataset == {"name": "a"}
+    # without caching, a new dataset is created each time
+    assert instantiate_dataset(_dataset_config("a")) is not dataset
+    assert len(config_utils._DATASET_CACHE) == 0
+
+
+def test_instantiate_dataset_with_cache():
+    dataset = instantiate_dataset(_dataset_config("a"), use_cache=True)
+    assert dataset == {"name": "a"}
+
+    # cache hit: the same config returns the same dataset
+    assert instantiate_dataset(_dataset_config("a"), use_cache=True) is dataset
+
+    # cache miss: a different config creates a new dataset and replaces the cached one
+    other_dataset = instantiate_dataset(_dataset_config("b"), use_cache=True)
+    assert other_dataset == {"name": "b"}
+    assert len(config_utils._DATASET_CACHE) == 1
+    assert instantiate_dataset(_dataset_config("b"), use_cache=True) is other_dataset
+
+    # the first dataset was evicted, so it gets instantiated again
+    dataset_again = instantiate_dataset(_dataset_config("a"), use_cache=True)
+    assert dataset_again == dataset
+    assert dataset_again is not dataset
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from src.utils import set_tokenizers_parallelism, task_utils
+
+
+@pytest.fixture
+def clean_environment(monkeypatch):
+    monkeypatch.delenv("TOKENIZERS_PARALLELISM", raising=False)
+    monkeypatch.setattr(task_utils, "_tokenizers_parallelism_set_here", False)
+
+
+def test_set_tokenizers_parallelism(clean_environment):
+    set_tokenizers_parallelism(num_workers=0)
+    assert os.environ["TOKENIZERS_PARALLELISM"] == "true"
+
+    # a subsequent job (e.g. in a multirun) with worker processes disables the parallelism
+    set_tokenizers_parallelism(num_workers=2)
+    assert os.environ["TOKENIZERS_PARALLELISM"] == "false"
+
+
+def test_set_tokenizers_parallelism_already_set(clean_environment, monkeypatch):
+    monkeypatch.setenv("TOKENIZERS_PARALLELISM", "true")
+
+    # a value that was set from outside is not changed
+    set_tokenizers_parallelism(num_workers=2)
+    assert os.environ["TOKENIZERS_PARALLELISM"] == "true"